@@ -1,9 +1,11 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from pathlib import Path
-import ipaddress
+import asyncio
+import logging
 import os
-from typing import Optional
+import re
+from typing import Annotated, Any, Optional
 from fastapi.responses import JSONResponse
 import traceback
 
@@ -23,36 +25,73 @@ BASE_DIR = Path(__file__).resolve().parent
 CONFIG_DIR = BASE_DIR / "config"
 TEMPLATE_DIR = BASE_DIR / "templates"
 
+logger = logging.getLogger(__name__)
+
+# Set APP_DEBUG=1 to include tracebacks in 500 responses
+DEBUG = os.environ.get("APP_DEBUG") == "1"
+
 # Initialise services
 net_cfg = NetworkConfig(CONFIG_DIR / "network_config.json")
 template_mgr = TemplateManager(TEMPLATE_DIR)
 
+# Shape check for a dotted quad; rejects junk before any splitting or int()
+_IPV4_RE = re.compile(r"\A(?:\d{1,3}\.){3}\d{1,3}\Z", re.ASCII)
+
+def _fast_parse_ipv4(s: str) -> int | None:
+    """
+    Parses a dotted-quad IPv4 address to its integer value without going
+    through ipaddress. Returns None for anything that isn't a valid IPv4.
+    """
+    if not _IPV4_RE.match(s):
+        return None
+    n = 0
+    for p in s.split("."):
+        # Same rule as ipaddress: no leading zeros
+        if len(p) > 1 and p[0] == "0":
+            return None
+        v = int(p)
+        if v > 255:
+            return None
+        n = (n << 8) | v
+    return n
+
 # --------------------------------------------------
 # Input model (Adaptive Card → Power Automate → API)
 # --------------------------------------------------
 
 class SwitchRequest(BaseModel):
+    # Constraints are enforced by pydantic-core before the handler runs
+    model_config = ConfigDict(frozen=True)
+
     mgmt_ip: str
     hostname: Optional[str] = None
-    serial: str
-    mac: str
+    serial: Annotated[str, Field(max_length=32)]
+    mac: Annotated[str, Field(pattern=r"^(?:[0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2}$")]
     location: str
     template: str
     send_to_central: bool = False
 
+# Declared as the /generate return type so FastAPI serializes it straight
+# to JSON bytes in pydantic-core instead of going through json.dumps
+class GenerateResponse(BaseModel):
+    success: bool
+    hostname: str
+    config: str
+    payload_json: dict[str, dict[str, Any]]
+    serial: str
+
 # --------------------------------------------------
 # Health check
 # --------------------------------------------------
 
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request, exc):
-    return JSONResponse(
-        status_code=500,
-        content={
-            "error": str(exc),
-            "traceback": traceback.format_exc()
-        }
-    )
+    logger.exception("Unhandled error on %s", request.url.path, exc_info=exc)
+
+    content = {"error": str(exc)}
+    if DEBUG:
+        content["traceback"] = "".join(traceback.format_exception(exc))
+    return JSONResponse(status_code=500, content=content)
 
 @app.get("/")
 def health():
@@ -62,60 +101,64 @@ def health():
 # Debug endpoints (to prove what Azure deployed)
 # --------------------------------------------------
 
+# Paths don't change after startup, so snapshot them once
+_STATIC_INFO = {
+    "cwd": os.getcwd(),
+    "base_dir": str(BASE_DIR),
+    "config_dir": str(CONFIG_DIR),
+    "template_dir": str(TEMPLATE_DIR),
+    "config_dir_exists": CONFIG_DIR.exists(),
+    "template_dir_exists": TEMPLATE_DIR.exists(),
+}
+
+# (dir mtime, sorted file names); refreshed when the directory changes
+_templates_cache: tuple[float, list[str]] | None = None
+
 @app.get("/debug/info")
 def debug_info():
-    return {
-        "cwd": os.getcwd(),
-        "base_dir": str(BASE_DIR),
-        "config_dir": str(CONFIG_DIR),
-        "template_dir": str(TEMPLATE_DIR),
-        "config_dir_exists": CONFIG_DIR.exists(),
-        "template_dir_exists": TEMPLATE_DIR.exists(),
-    }
+    return _STATIC_INFO
 
 @app.get("/debug/templates")
 def debug_templates():
-    if not TEMPLATE_DIR.exists():
+    global _templates_cache
+
+    try:
+        mtime = TEMPLATE_DIR.stat().st_mtime
+    except FileNotFoundError:
         return {"template_dir": str(TEMPLATE_DIR), "exists": False, "files": []}
 
-    files = sorted([p.name for p in TEMPLATE_DIR.glob("*.j2")])
-    return {"template_dir": str(TEMPLATE_DIR), "exists": True, "files": files}
+    if _templates_cache is None or _templates_cache[0] != mtime:
+        _templates_cache = (mtime, sorted([p.name for p in TEMPLATE_DIR.glob("*.j2")]))
+    return {"template_dir": str(TEMPLATE_DIR), "exists": True, "files": _templates_cache[1]}
 
 # --------------------------------------------------
 # Main generator endpoint
 # --------------------------------------------------
 
 @app.post("/generate")
-def generate_config(req: SwitchRequest):
+async def generate_config(req: SwitchRequest) -> GenerateResponse:
     # ---- 1. Validate Management IP ----
-    try:
-        target_ip = ipaddress.ip_address(req.mgmt_ip)
-    except Exception:
+    target_ip = _fast_parse_ipv4(req.mgmt_ip)
+    if target_ip is None:
         raise HTTPException(status_code=400, detail="Invalid management IP")
 
     # ---- 2. Identify Site from network_config.json ----
     # This assumes net_cfg has a helper to find the site dict by IP
-    site_key, site_info = net_cfg.find_site_by_ip(req.mgmt_ip)
-    if not site_info:
+    # Reload swaps in a whole new config snapshot; the site below carries the
+    # snapshot it came from, so later lookups stay consistent with it
+    await asyncio.to_thread(net_cfg.reload_if_changed)
+    site = net_cfg.resolve(target_ip, req.template)
+    if not site:
         raise HTTPException(status_code=400, detail="IP does not match any known site in network_config.json")
 
     # ---- 3. Load Template ----
     try:
-        template_text = template_mgr.load_template(req.template)
+        template = await asyncio.to_thread(template_mgr.get_template, req.template)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
     # ---- 4. Derived Network Values ----
     hostname = (req.hostname or "").strip() or net_cfg.generate_hostname(req.mgmt_ip, req.template)
-    
-    # Extract site-specific base values
-    data_vlan = site_info.get("data_vlan", {})
-    voice_vlan = site_info.get("voice_vlan", {})
-    gateway = site_info.get("gateway")
-    
-    # Determine profile (av vs standard)
-    profile_type = "av" if "av" in req.template.lower() else "standard"
-    profile_vlans = site_info.get("profiles", {}).get(profile_type, {})
 
     # ---- 5. Build Aruba Central Variables (_sys_) ----
     central_vars = {
@@ -124,19 +167,18 @@ def generate_config(req: SwitchRequest):
         "_sys_serial": req.serial,
         "_sys_lan_mac": req.mac,
         "_sys_location": req.location or "default_location",
-        "_sys_gateway": gateway,
-        "_sys_data_vlan_id": data_vlan.get("id"),
-        "_sys_data_vlan_name": data_vlan.get("name"),
+        "_sys_gateway": site.gateway,
+        "_sys_data_vlan_id": site.data_vlan_id,
+        "_sys_data_vlan_name": site.data_vlan_name,
     }
 
     # Add Voice VLAN if present for the site
-    if voice_vlan:
-        central_vars["_sys_voice_vlan_id"] = voice_vlan.get("id")
-        central_vars["_sys_voice_vlan_name"] = voice_vlan.get("name")
+    if site.voice_id is not None:
+        central_vars["_sys_voice_vlan_id"] = site.voice_id
+        central_vars["_sys_voice_vlan_name"] = site.voice_name
 
     # Add Profile-Specific VLANs from your JSON
-    for vid, vname in profile_vlans.items():
-        central_vars[f"_sys_{vid}_vlan_name"] = vname
+    central_vars.update(net_cfg.profile_central_vars(site))
 
     # ---- 6. Format Payload with Serial Number as Key ----
     # This matches the specific requirement for Aruba Central variable imports
@@ -144,27 +186,19 @@ def generate_config(req: SwitchRequest):
         req.serial: central_vars
     }
 
-    # ---- 7. Build CLI Config (Replacement Logic) ----
-    profile_block = "".join([f"vlan {vid}\n name {vname}\n!\n" for vid, vname in profile_vlans.items()])
-    
-    replacements = {
-        "{{hostname}}": hostname,
-        "{{access_vlan}}": data_vlan.get("id", "1"),
-        # Fixed: Use voice_vlan.get("id") instead of voice_id
-        "{{voice_vlan}}": voice_vlan.get("id", "") if voice_vlan else "",
-        "{{gateway}}": gateway,
-        "{{location}}": req.location,
-        "{{profile_vlans}}": profile_block
-    }
+    # ---- 7. Render CLI Config ----
+    cfg = template.render(
+        net_cfg.template_vars(site),
+        hostname=hostname,
+        management_ip=req.mgmt_ip,
+        location=req.location,
+        snmp_location=req.location,
+    )
 
-    cfg = template_text
-    for k, v in replacements.items():
-        cfg = cfg.replace(k, str(v or ""))
-
-    return {
-        "success": True,
-        "hostname": hostname,
-        "config": cfg,
-        "payload_json": central_payload,  # Change this from central_vars to central_payload
-        "serial": req.serial
-    }
\ No newline at end of file
+    return GenerateResponse(
+        success=True,
+        hostname=hostname,
+        config=cfg,
+        payload_json=central_payload,  # Change this from central_vars to central_payload
+        serial=req.serial
+    )
\ No newline at end of file
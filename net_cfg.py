@@ -1,55 +1,25 @@
-import json
-import os
-import ipaddress
+"""
+Legacy function-style API, kept for scripts that still import it.
+Everything is served by one shared NetworkConfig instance, so the JSON is
+parsed once and only re-read when the file changes on disk.
+"""
+from pathlib import Path
+
+from services.network_config import NetworkConfig
+
+_cfg = NetworkConfig(Path(__file__).resolve().parent / "config" / "network_config.json")
 
 def load_network_config():
-    """Loads the network_config.json file."""
-    config_path = os.path.join("config", "network_config.json")
-    if not os.path.exists(config_path):
-        return {}
-    with open(config_path, "r") as f:
-        return json.load(f)
+    """Returns the parsed network_config.json."""
+    _cfg.reload_if_changed()
+    return _cfg.data
 
 def find_site_by_ip(mgmt_ip):
-    """
-    Identifies the site by checking which subnet the mgmt_ip falls into.
-    Returns (site_key, site_info) or (None, None).
-    """
-    try:
-        target_ip = ipaddress.ip_address(mgmt_ip)
-        network_data = load_network_config()
-
-        for site_key, site_info in network_data.items():
-            # Create a network object from the JSON address and mask
-            net_addr = site_info.get("network_address")
-            net_mask = site_info.get("subnet_mask")
-            
-            if net_addr and net_mask:
-                network = ipaddress.ip_network(f"{net_addr}/{net_mask}", strict=False)
-                if target_ip in network:
-                    return site_key, site_info
-                    
-        return None, None
-    except Exception as e:
-        print(f"Error in find_site_by_ip: {e}")
-        return None, None
+    """Returns (site_key, site_info) or (None, None)."""
+    _cfg.reload_if_changed()
+    return _cfg.find_site_by_ip(mgmt_ip)
 
-def generate_hostname(mgmt_ip, template_name):
-    """
-    Generates a hostname based on the last three octets of the IP.
-    Example: 172.22.18.241 -> sw-22-18-241
-    """
-    octets = mgmt_ip.split('.')
-    suffix = "-".join(octets[1:]) # Uses 22-18-241
-    
-    if "6300" in template_name:
-        prefix = "ae6300"
-    elif "4100" in template_name:
-        prefix = "ae4100i"
-    else:
-        prefix = "sw"
-        
-    return f"{prefix}-{suffix}"
+generate_hostname = _cfg.generate_hostname
 
 def get_data_vlan(mgmt_ip):
     """Helper to get data vlan details for a specific IP site."""
@@ -70,4 +40,4 @@ def get_voice_vlan(mgmt_ip):
 def get_gateway(mgmt_ip):
     """Retrieves the gateway for the site associated with the IP."""
     _, site_info = find_site_by_ip(mgmt_ip)
-    return site_info.get("gateway", "") if site_info else ""
\ No newline at end of file
+    return site_info.get("gateway", "") if site_info else ""
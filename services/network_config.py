@@ -1,55 +1,320 @@
-import json
+import bisect
 import ipaddress
+import re
+from dataclasses import dataclass, field
 from pathlib import Path
 
+import orjson
+
+# Switch management VLAN, hardcoded in every template and always trunked
+MGMT_VLAN_ID = "885"
+
+# Hardware model and profile markers in a template name, found in one scan
+_TMPL_RE = re.compile(r"(?P<av>av)|(?P<m6300>6300)|(?P<m4100>4100)", re.IGNORECASE)
+
+
+def _prefix_len(mask):
+    """
+    Converts a dotted netmask ("255.255.254.0"), a host mask ("0.0.1.255")
+    or a bare prefix ("23") to a prefix length, the same forms ip_network()
+    accepts. Raises ValueError for anything else.
+    """
+    mask = str(mask)
+    if mask.isdigit():
+        prefix = int(mask)
+        if prefix > 32:
+            raise ValueError(f"{mask} is not a valid netmask")
+        return prefix
+
+    bits = int(ipaddress.IPv4Address(mask))
+    # Netmask first, then host mask, as ipaddress does
+    for candidate in (bits, bits ^ 0xFFFFFFFF):
+        prefix = bin(candidate).count("1")
+        if candidate == (0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF:
+            return prefix
+    raise ValueError(f"{mask} is not a valid netmask")
+
+
+@dataclass(slots=True)
+class _ConfigState:
+    """
+    One parsed config plus everything derived from it. Reloads build a new
+    one and swap it in with a single assignment, so a request that grabbed
+    a snapshot never sees a half-updated mix of old and new.
+    """
+    mtime: float | None
+    data: dict
+    networks: list
+    lows: list
+    # Set only when site subnets overlap: the ranges in file order, scanned
+    # linearly so the first matching site wins, as it always has
+    scan: list | None = None
+    # (site_key, profile_type) -> Central var pairs / template variables;
+    # these live and die with the snapshot
+    profile_central_vars: dict = field(default_factory=dict)
+    template_vars: dict = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class SiteView:
+    """Everything /generate needs from one site, resolved in a single lookup."""
+    key: str
+    data_vlan_id: str | None
+    data_vlan_name: str | None
+    voice_id: str | None
+    voice_name: str | None
+    gateway: str | None
+    profile_type: str
+    profile_vlans: dict
+    # Config snapshot the site was resolved from
+    state: _ConfigState = field(repr=False)
+
+
 class NetworkConfig:
     def __init__(self, config_path):
         self.config_path = config_path
-        self.data = self._load_config()
+        self._state = self._build_state(self._stat_mtime(), self._load_config())
+
+    @property
+    def data(self):
+        return self._state.data
+
+    def _stat_mtime(self):
+        try:
+            return Path(self.config_path).stat().st_mtime
+        except FileNotFoundError:
+            return None
 
     def _load_config(self):
         """Loads the JSON file into the class memory."""
-        if not Path(self.config_path).exists():
+        path = Path(self.config_path)
+        if not path.exists():
             print(f"ERROR: Config file not found at {self.config_path}")
             return {}
-        with open(self.config_path, "r") as f:
-            return json.load(f)
+        # orjson parses the raw bytes directly, no separate decode step
+        return orjson.loads(path.read_bytes())
 
-    def find_site_by_ip(self, mgmt_ip):
+    def reload_if_changed(self):
         """
-        Scans all sites in the JSON to find which subnet the IP belongs to.
-        This is the method your app.py is currently missing!
+        Re-reads the JSON only when its mtime has moved on, so long-lived
+        workers pick up edits without a restart.
         """
+        mtime = self._stat_mtime()
+        if mtime == self._state.mtime:
+            return
+        if mtime is None:
+            # Mid-deploy or being re-created: keep serving the old config
+            print(f"ERROR: Config file not found at {self.config_path}, keeping previous config")
+            return
         try:
-            target_ip = ipaddress.ip_address(mgmt_ip)
-            
-            for site_key, site_info in self.data.items():
-                net_addr = site_info.get("network_address")
-                net_mask = site_info.get("subnet_mask")
-                
-                if net_addr and net_mask:
-                    # strict=False allows host IPs to be checked against the network
-                    network = ipaddress.ip_network(f"{net_addr}/{net_mask}", strict=False)
-                    if target_ip in network:
-                        return site_key, site_info
-            
-            return None, None
-        except Exception as e:
-            print(f"Subnet lookup error: {e}")
+            state = self._build_state(mtime, self._load_config())
+        except (ValueError, AttributeError, TypeError) as e:
+            # Half-written edit or a malformed entry: keep serving the old
+            # config and retry on the next call, since the stored mtime is
+            # left untouched. (orjson.JSONDecodeError is a ValueError.)
+            print(f"ERROR: Could not load {self.config_path}, keeping previous config: {e}")
+            return
+        self._state = state
+
+    @staticmethod
+    def _build_state(mtime, data):
+        """
+        Parses every site subnet once and keeps them sorted by first address,
+        so lookups are a bisect plus one bound check instead of a linear scan.
+        Overlapping subnets break the bisect, so they fall back to a scan.
+        """
+        networks = []
+        for site_key, site_info in data.items():
+            net_addr = site_info.get("network_address")
+            net_mask = site_info.get("subnet_mask")
+
+            if net_addr and net_mask:
+                try:
+                    addr = int(ipaddress.IPv4Address(net_addr))
+                    prefix = _prefix_len(net_mask)
+                except ValueError as e:
+                    print(f"Skipping site {site_key}: {e}")
+                    continue
+                # Mask off any host bits set in network_address
+                host_bits = (1 << (32 - prefix)) - 1
+                low = addr & ~host_bits
+                networks.append((low, low | host_bits, site_key, site_info))
+
+        scan = None
+        ordered = sorted(networks, key=lambda n: n[0])
+        overlaps = [
+            (prev[2], cur[2]) for prev, cur in zip(ordered, ordered[1:]) if cur[0] <= prev[1]
+        ]
+        if overlaps:
+            pairs = ", ".join(f"{a}/{b}" for a, b in overlaps)
+            print(f"WARNING: Overlapping site subnets ({pairs}), using linear site lookup")
+            scan = networks
+
+        return _ConfigState(
+            mtime=mtime,
+            data=data,
+            networks=ordered,
+            lows=[n[0] for n in ordered],
+            scan=scan,
+        )
+
+    def find_site_by_ip(self, mgmt_ip):
+        """
+        Finds which site subnet the IP belongs to. Accepts a dotted-quad
+        string or an already-parsed integer address.
+        Returns (site_key, site_info) or (None, None).
+        """
+        return self._lookup(self._state, mgmt_ip)
+
+    @staticmethod
+    def _lookup(state, mgmt_ip):
+        if isinstance(mgmt_ip, int):
+            target = mgmt_ip
+        else:
+            try:
+                target = int(ipaddress.IPv4Address(mgmt_ip))
+            except Exception as e:
+                print(f"Subnet lookup error: {e}")
+                return None, None
+
+        if state.scan is not None:
+            for low, high, site_key, site_info in state.scan:
+                if low <= target <= high:
+                    return site_key, site_info
             return None, None
 
+        i = bisect.bisect_right(state.lows, target) - 1
+        if i >= 0:
+            _, high, site_key, site_info = state.networks[i]
+            if target <= high:
+                return site_key, site_info
+
+        return None, None
+
+    def resolve(self, mgmt_ip, template):
+        """
+        Looks the site up once and pulls out the data/voice VLANs, gateway
+        and profile VLANs for the template. Returns None if no site matches.
+        """
+        state = self._state
+        site_key, site_info = self._lookup(state, mgmt_ip)
+        if not site_info:
+            return None
+
+        data_vlan = site_info.get("data_vlan", {})
+        voice_vlan = site_info.get("voice_vlan", {})
+
+        _, profile_type = self._classify_template(template)
+
+        return SiteView(
+            key=site_key,
+            data_vlan_id=data_vlan.get("id"),
+            data_vlan_name=data_vlan.get("name"),
+            voice_id=voice_vlan.get("id") if voice_vlan else None,
+            voice_name=voice_vlan.get("name") if voice_vlan else None,
+            gateway=site_info.get("gateway"),
+            profile_type=profile_type,
+            profile_vlans=site_info.get("profiles", {}).get(profile_type, {}),
+            state=state,
+        )
+
+    def template_vars(self, site):
+        """
+        Returns the site-level variables for rendering a CLI template. These
+        only depend on the site and profile, so they're built once and reused;
+        callers layer the per-request values (hostname, IP, location) on top.
+        Built from the site's own config snapshot, so the cache never mixes
+        values from two versions of the file.
+        """
+        state = site.state
+        cache_key = (site.key, site.profile_type)
+        tvars = state.template_vars.get(cache_key)
+        if tvars is None:
+            site_info = state.data[site.key]
+            data_vlan = site_info.get("data_vlan", {})
+            voice_vlan = site_info.get("voice_vlan", {})
+            profile_vlans = site_info.get("profiles", {}).get(site.profile_type, {})
+            data_id = data_vlan.get("id")
+            voice_id = voice_vlan.get("id") if voice_vlan else None
+
+            # Same as the Central templates: data VLAN first (plus voice, which
+            # the AV template leaves off its uplinks), then the rest numerically
+            lead = (data_id,) if site.profile_type == "av" else (data_id, voice_id)
+            # Ids may be ints or strings in the JSON; compare and join as strings
+            trunk = self._trunk_ids(site.key, lead)
+            rest = set(self._trunk_ids(site.key, (*profile_vlans, MGMT_VLAN_ID)))
+            trunk += sorted(rest - set(trunk), key=int)
+
+            tvars = {
+                "gateway": site_info.get("gateway"),
+                "access_vlan": data_id or "1",
+                "data_vlan_id": data_id,
+                "data_vlan_name": data_vlan.get("name"),
+                "data_vlan": {"id": data_id, "name": data_vlan.get("name")},
+                "voice_vlan": {"id": voice_id, "name": voice_vlan.get("name")} if voice_vlan else None,
+                "voice_vlan_id": voice_id,
+                "voice_vlan_name": voice_vlan.get("name") if voice_vlan else None,
+                "profile_vlans": "".join(
+                    "vlan {}\n name {}\n!\n".format(vid, vname) for vid, vname in profile_vlans.items()
+                ),
+                "av_vlans": [{"id": vid, "name": vname} for vid, vname in profile_vlans.items()],
+                "trunk_allowed_vlans": ",".join(trunk),
+            }
+            state.template_vars[cache_key] = tvars
+        return tvars
+
+    @staticmethod
+    def _trunk_ids(site_key, vids):
+        """Returns the VLAN ids as strings, skipping blanks and non-numeric ids."""
+        ids = []
+        for vid in vids:
+            if vid is None or vid == "":
+                continue
+            if str(vid).isdigit():
+                ids.append(str(vid))
+            else:
+                print(f"Skipping non-numeric VLAN id {vid!r} in {site_key} trunk list")
+        return ids
+
+    def profile_central_vars(self, site):
+        """Returns the (_sys_<vid>_vlan_name, name) pairs for a site's profile, memoized."""
+        cache_key = (site.key, site.profile_type)
+        pairs = site.state.profile_central_vars.get(cache_key)
+        if pairs is None:
+            pairs = tuple((f"_sys_{vid}_vlan_name", vname) for vid, vname in site.profile_vlans.items())
+            site.state.profile_central_vars[cache_key] = pairs
+        return pairs
+
     def generate_hostname(self, mgmt_ip, template_name):
         """Generates a standardized hostname based on IP and hardware."""
         octets = mgmt_ip.split('.')
         # Uses last 3 octets: 172.22.18.241 -> 22-18-241
         suffix = "-".join(octets[1:]) 
-        
-        t_name = template_name.lower()
-        if "6300" in t_name:
+
+        prefix, _ = self._classify_template(template_name)
+        return f"{prefix}-{suffix}"
+
+    @staticmethod
+    def _classify_template(name):
+        """
+        Returns (hostname_prefix, profile_type) for a template name, e.g.
+        "6300m-av" -> ("ae6300", "av"). 6300 wins over 4100 if both appear.
+        """
+        av = m6300 = m4100 = False
+        for m in _TMPL_RE.finditer(name):
+            kind = m.lastgroup
+            if kind == "av":
+                av = True
+            elif kind == "m6300":
+                m6300 = True
+            else:
+                m4100 = True
+
+        if m6300:
             prefix = "ae6300"
-        elif "4100" in t_name:
+        elif m4100:
             prefix = "ae4100i"
         else:
             prefix = "sw"
-            
-        return f"{prefix}-{suffix}"
\ No newline at end of file
+
+        return prefix, "av" if av else "standard"
\ No newline at end of file
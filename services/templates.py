@@ -1,9 +1,22 @@
 # services/templates.py
 from pathlib import Path
 
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateNotFound
+
 class TemplateManager:
     def __init__(self, template_dir: Path):
         self.template_dir = Path(template_dir)
+        # Templates are compiled once and the bytecode is cached on disk, so
+        # warm requests just call the compiled render function.
+        self.env = Environment(
+            loader=FileSystemLoader(self.template_dir),
+            bytecode_cache=FileSystemBytecodeCache(),
+            trim_blocks=True,
+            lstrip_blocks=True,
+            keep_trailing_newline=True,
+            # Missing values render as empty, not "None"
+            finalize=lambda v: "" if v is None else v,
+        )
 
     def _normalize(self, name: str) -> str:
         """
@@ -13,7 +26,8 @@ class TemplateManager:
         and normalize to: "6300m-standard"
         """
         name = (name or "").strip()
-        if name.lower().endswith(".j2"):
+        # Only the suffix needs a case-insensitive check
+        if name[-3:].lower() == ".j2":
             name = name[:-3]
         return name
 
@@ -21,14 +35,25 @@ class TemplateManager:
         # Return keys without extension
         return sorted([p.stem for p in self.template_dir.glob("*.j2")])
 
-    def load_template(self, name: str) -> str:
-        key = self._normalize(name)
-        path = self.template_dir / f"{key}.j2"
+    def _not_found(self, key: str) -> FileNotFoundError:
+        available = ", ".join(self.list_templates())
+        return FileNotFoundError(
+            f"Template not found: {self.template_dir / f'{key}.j2'} (available: {available})"
+        )
 
-        if not path.exists():
-            available = ", ".join(self.list_templates())
-            raise FileNotFoundError(
-                f"Template not found: {path} (available: {available})"
-            )
+    def get_template(self, name: str):
+        """Returns the compiled Jinja template for a name."""
+        key = self._normalize(name)
+        try:
+            return self.env.get_template(f"{key}.j2")
+        except TemplateNotFound:
+            raise self._not_found(key)
 
-        return path.read_text(encoding="utf-8")
+    def load_template(self, name: str) -> str:
+        """Returns the raw template source, via the Jinja loader."""
+        key = self._normalize(name)
+        try:
+            source, _, _ = self.env.loader.get_source(self.env, f"{key}.j2")
+        except TemplateNotFound:
+            raise self._not_found(key)
+        return source
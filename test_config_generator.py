@@ -0,0 +1,247 @@
+import ipaddress
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import _fast_parse_ipv4, app
+from services.network_config import NetworkConfig, _prefix_len
+
+CONFIG_PATH = Path(__file__).resolve().parent / "config" / "network_config.json"
+
+
+def _write(path, data, bump):
+    path.write_text(data if isinstance(data, str) else json.dumps(data))
+    # Force a distinct mtime so reload_if_changed notices the edit
+    st = path.stat()
+    os.utime(path, (st.st_atime, st.st_mtime + bump))
+
+
+def _request(**overrides):
+    body = {
+        "mgmt_ip": "172.22.27.41",
+        "serial": "TW52KYL01X",
+        "mac": "7c:a8:ec:55:20:c0",
+        "location": "Anatomy HO Schild",
+        "template": "6300m-av",
+    }
+    body.update(overrides)
+    return body
+
+
+@pytest.fixture
+def client():
+    return TestClient(app, raise_server_exceptions=False)
+
+
+@pytest.fixture
+def cfg_path(tmp_path):
+    path = tmp_path / "network_config.json"
+    shutil.copy(CONFIG_PATH, path)
+    return path
+
+
+def test_reload_keeps_previous_config_on_bad_json(cfg_path):
+    net_cfg = NetworkConfig(cfg_path)
+
+    _write(cfg_path, "{ half written", bump=10)
+    net_cfg.reload_if_changed()
+    assert net_cfg.resolve("172.22.27.41", "6300m-av").data_vlan_id == "704"
+
+    # Retried on the next call once the file is valid again
+    data = json.loads(CONFIG_PATH.read_text())
+    data["aruba-sw"]["data_vlan"]["id"] = "999"
+    _write(cfg_path, data, bump=20)
+    net_cfg.reload_if_changed()
+    assert net_cfg.resolve("172.22.27.41", "6300m-av").data_vlan_id == "999"
+
+
+def test_reload_keeps_previous_config_on_bad_shape(cfg_path):
+    net_cfg = NetworkConfig(cfg_path)
+
+    _write(cfg_path, {"aruba-sw": "not a site"}, bump=10)
+    net_cfg.reload_if_changed()
+    assert net_cfg.resolve("172.22.27.41", "6300m-av").key == "aruba-sw"
+
+
+def test_reload_keeps_previous_config_when_file_missing(cfg_path):
+    net_cfg = NetworkConfig(cfg_path)
+
+    cfg_path.unlink()
+    net_cfg.reload_if_changed()
+    assert net_cfg.resolve("172.22.27.41", "6300m-av").key == "aruba-sw"
+
+
+def test_find_site_by_ip_boundaries():
+    net_cfg = NetworkConfig(CONFIG_PATH)
+    for site_key, site_info in net_cfg.data.items():
+        network = ipaddress.ip_network(
+            f"{site_info['network_address']}/{site_info['subnet_mask']}", strict=False
+        )
+        assert net_cfg.find_site_by_ip(str(network.network_address))[0] == site_key
+        assert net_cfg.find_site_by_ip(int(network.broadcast_address))[0] == site_key
+        assert net_cfg.find_site_by_ip(str(network.broadcast_address + 1))[0] != site_key
+
+    assert net_cfg.find_site_by_ip("8.8.8.8") == (None, None)
+    assert net_cfg.find_site_by_ip("not-an-ip") == (None, None)
+
+
+def test_find_site_by_ip_nested_subnets(tmp_path):
+    path = tmp_path / "network_config.json"
+    _write(path, {
+        "campus": {"network_address": "10.0.0.0", "subnet_mask": "255.255.0.0"},
+        "building": {"network_address": "10.0.5.0", "subnet_mask": "255.255.255.0"},
+    }, bump=0)
+    net_cfg = NetworkConfig(path)
+
+    # First match in file order wins, as with the original linear scan
+    assert net_cfg.find_site_by_ip("10.0.9.1")[0] == "campus"
+    assert net_cfg.find_site_by_ip("10.0.5.1")[0] == "campus"
+    assert net_cfg.find_site_by_ip("10.1.0.1") == (None, None)
+
+
+@pytest.mark.parametrize("s", [
+    "1.2.3.4", "0.0.0.0", "255.255.255.255", "172.22.27.41",
+    "01.2.3.4", "256.1.1.1", "1.2.3", "1.2.3.4.5", "1..2.3", "a.b.c.d",
+    "1.2.3.\u00b2", " 1.2.3.4", "1.2.3.4\n", "1.2.3.1234", "", "::1",
+])
+def test_fast_parse_ipv4_matches_ipaddress(s):
+    try:
+        expected = int(ipaddress.IPv4Address(s))
+    except ValueError:
+        expected = None
+    assert _fast_parse_ipv4(s) == expected
+
+
+@pytest.mark.parametrize("mgmt_ip", ["::1", "172.022.27.41"])
+def test_generate_rejects_non_ipv4(client, mgmt_ip):
+    r = client.post("/generate", json=_request(mgmt_ip=mgmt_ip))
+    assert r.status_code == 400
+    assert r.json() == {"detail": "Invalid management IP"}
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("6300m-av", ("ae6300", "av")),
+    ("4100i-AV.j2", ("ae4100i", "av")),
+    ("6300M-standard", ("ae6300", "standard")),
+    ("4100-6300", ("ae6300", "standard")),
+    ("unknown", ("sw", "standard")),
+])
+def test_classify_template(name, expected):
+    assert NetworkConfig._classify_template(name) == expected
+
+
+def _boom(*args, **kwargs):
+    raise RuntimeError("boom")
+
+
+@pytest.mark.parametrize("debug", [False, True])
+def test_unhandled_error_traceback_only_in_debug(client, monkeypatch, debug):
+    monkeypatch.setattr("app.DEBUG", debug)
+    monkeypatch.setattr("app.net_cfg.resolve", _boom)
+
+    r = client.post("/generate", json=_request())
+    assert r.status_code == 500
+    assert r.json()["error"] == "boom"
+    assert ("traceback" in r.json()) is debug
+
+
+@pytest.mark.parametrize("overrides", [
+    {"mac": "7c-a8-ec-55-20-c0"},
+    {"mac": "7ca8ec5520c0"},
+    {"serial": "X" * 33},
+])
+def test_generate_rejects_bad_mac_or_serial(client, overrides):
+    r = client.post("/generate", json=_request(**overrides))
+    assert r.status_code == 422
+
+
+def test_generate_response_fields(client):
+    r = client.post("/generate", json=_request())
+    assert r.status_code == 200
+    body = r.json()
+
+    assert set(body) == {"success", "hostname", "config", "payload_json", "serial"}
+    assert body["success"] is True
+    assert body["hostname"] == "ae6300-22-27-41"
+    assert body["serial"] == "TW52KYL01X"
+    assert body["config"].startswith("hostname ae6300-22-27-41\n")
+
+    central_vars = body["payload_json"]["TW52KYL01X"]
+    assert central_vars["_sys_mgnt_ip"] == "172.22.27.41"
+    assert central_vars["_sys_data_vlan_id"] == "704"
+    assert central_vars["_sys_520_vlan_name"] == "10.9.45.0/24_AV_Crestron_Air"
+
+
+def test_trunk_list_follows_central_templates():
+    net_cfg = NetworkConfig(CONFIG_PATH)
+    av = net_cfg.template_vars(net_cfg.resolve("172.22.27.41", "6300m-av"))
+    std = net_cfg.template_vars(net_cfg.resolve("172.22.27.41", "6300m-standard"))
+
+    assert av["trunk_allowed_vlans"] == "704,520,530,707,712,807,850,885,909"
+    assert std["trunk_allowed_vlans"] == "704,13,487,885,915,990"
+
+
+def test_trunk_list_accepts_integer_vlan_ids(cfg_path):
+    data = json.loads(cfg_path.read_text())
+    data["aruba-sw"]["data_vlan"]["id"] = 704
+    data["aruba-sw"]["voice_vlan"]["id"] = 13
+    # Same VLAN as the integer data id, so it must de-dup against it
+    data["aruba-sw"]["profiles"]["standard"]["704"] = "dup"
+    _write(cfg_path, data, bump=0)
+    net_cfg = NetworkConfig(cfg_path)
+
+    std = net_cfg.template_vars(net_cfg.resolve("172.22.27.41", "6300m-standard"))
+    assert std["trunk_allowed_vlans"] == "704,13,487,885,915,990"
+
+
+def test_trunk_list_skips_non_numeric_ids(cfg_path):
+    data = json.loads(cfg_path.read_text())
+    data["aruba-sw"]["voice_vlan"]["id"] = "voice"
+    data["aruba-sw"]["profiles"]["standard"]["cctv"] = "bad"
+    _write(cfg_path, data, bump=0)
+    net_cfg = NetworkConfig(cfg_path)
+
+    std = net_cfg.template_vars(net_cfg.resolve("172.22.27.41", "6300m-standard"))
+    assert std["trunk_allowed_vlans"] == "704,487,885,915,990"
+
+
+@pytest.mark.parametrize("mask, prefix", [
+    ("255.255.255.0", 24),
+    ("255.255.254.0", 23),
+    ("0.0.0.255", 24),
+    ("0.0.1.255", 23),
+    ("0.0.0.0", 0),
+    ("255.255.255.255", 32),
+    ("24", 24),
+])
+def test_prefix_len(mask, prefix):
+    assert _prefix_len(mask) == prefix
+
+
+@pytest.mark.parametrize("mask", ["255.0.255.0", "33", "not-a-mask"])
+def test_prefix_len_rejects_invalid(mask):
+    with pytest.raises(ValueError):
+        _prefix_len(mask)
+
+
+def test_reload_invalidates_cached_template_vars(cfg_path):
+    net_cfg = NetworkConfig(cfg_path)
+    old_site = net_cfg.resolve("172.22.27.41", "6300m-av")
+    assert net_cfg.template_vars(old_site)["data_vlan_id"] == "704"
+
+    data = json.loads(cfg_path.read_text())
+    data["aruba-sw"]["data_vlan"]["id"] = "999"
+    _write(cfg_path, data, bump=10)
+    net_cfg.reload_if_changed()
+
+    # A site resolved before the reload keeps its own snapshot...
+    assert net_cfg.template_vars(old_site)["data_vlan_id"] == "704"
+    # ...and doesn't leak into the new one
+    site = net_cfg.resolve("172.22.27.41", "6300m-av")
+    assert site.data_vlan_id == "999"
+    assert net_cfg.template_vars(site)["data_vlan_id"] == "999"
+    assert net_cfg.template_vars(site)["trunk_allowed_vlans"].startswith("999,")